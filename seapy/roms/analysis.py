@@ -9,20 +9,38 @@
 """
 
 import numpy as np
-from joblib import Parallel, delayed
 import seapy
-import netCDF4
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
 from rich.progress import track
 
 
+def __depth_factors(grid):
+    """
+    Internal function to return the depths without zeta and the factor
+    that scales zeta into them. For both transforms,
+    depth = z0 + zeta * (1 + z0 / h), which lets the zeta correction
+    broadcast across any leading time dimension. The arrays are returned
+    read-only so they may be shared between threads.
+    """
+    z0 = grid.depth_rho.view()
+    zfac = 1.0 + z0 / grid.h
+    z0.flags.writeable = False
+    zfac.flags.writeable = False
+    return z0, zfac
+
+
 def __find_surface_thread(grid, field, value, zeta, const_depth=False,
-                          k_values=False, u_grid=False, v_grid=False):
+                          k_values=False, u_grid=False, v_grid=False,
+                          factors=None):
     """
     Internal function to find a value in field_a and return the
-    values from field_b at the same positions.
+    values from field_b at the same positions. The field may be a single
+    [k,j,i] record or a stack of [t,k,j,i] records with zeta as [t,j,i].
     """
-    depth = seapy.roms.depth(grid.vtransform, grid.h, grid.hc,
-                             grid.s_rho, grid.cs_r, zeta)
+    z0, zfac = __depth_factors(grid) if factors is None else factors
+    depth = z0 + np.expand_dims(zeta, -3) * zfac
     if u_grid:
         depth = seapy.model.rho2u(depth)
     elif v_grid:
@@ -34,32 +52,42 @@ def __find_surface_thread(grid, field, value, zeta, const_depth=False,
     else:
         field_a, field_b = field, depth
 
-    # Determine the upper and lower bounds of the value in the field
-    tmp = np.ma.masked_equal(
-        np.diff(((field_a - value) < 0).astype(np.short), axis=0), 0)
-    factor = -np.sign(np.mean(np.diff(field, axis=0))).astype(np.short)
+    # Determine the upper and lower bounds of the value in the field. The
+    # work is done on plain arrays, and the mask is built once at the end.
+    tmp = np.ma.filled(np.diff(((field_a - value) < 0).astype(np.short),
+                               axis=-3), 0)
+    factor = -np.sign(np.mean(np.diff(field, axis=-3), axis=(-3, -2, -1),
+                              keepdims=True)).astype(np.short)
 
     # Determine the points of the upper bound and the lower bound
-    bad = np.sum(tmp, axis=0).astype(bool)
-    k_ones = np.arange(grid.n, dtype=np.short)
-    upper = (k_ones[:, np.newaxis, np.newaxis] ==
-             np.argmax(np.abs(tmp), axis=0)) * bad
-    k_ones = np.arange(grid.n, dtype=np.short) - factor
-    lower = (k_ones[:, np.newaxis, np.newaxis] ==
-             np.argmax(np.abs(tmp), axis=0)) * bad
+    found = np.sum(tmp, axis=-3, keepdims=True) != 0
+    kbnd = np.expand_dims(np.argmax(np.abs(tmp), axis=-3), -3)
+    k_ones = np.arange(grid.n, dtype=np.short)[:, np.newaxis, np.newaxis]
+    upper = (k_ones == kbnd) & found
+    lower = ((k_ones - factor) == kbnd) & found
 
     # Now that we have the bounds, we can linearly interpolate to
     # find where the value lies
-    u_a = np.sum(field_a * upper, axis=0)
-    d_a = u_a - np.sum(field_a * lower, axis=0)
-    d_z = (u_a - value) / d_a
+    fa = np.ma.filled(field_a, 0)
+    u_a = np.sum(fa * upper, axis=-3)
+    d_a = u_a - np.sum(fa * lower, axis=-3)
+    d_z = np.divide(u_a - value, d_a, out=np.zeros(d_a.shape), where=d_a != 0)
+
+    # Mask where the value was not bounded or a bound was masked
+    mask = d_a == 0
+    for fld in (field_a, field_b):
+        fmask = np.ma.getmask(fld)
+        if fmask is not np.ma.nomask:
+            mask |= np.any(fmask & (upper | lower), axis=-3)
     if k_values:
-        return np.argmax(upper, axis=0) + factor * d_z
+        return np.ma.array(np.argmax(upper, axis=-3) +
+                           factor[..., 0, :, :] * d_z, mask=mask, copy=False)
 
     # Calculate the values from field_b
-    u_b = np.sum(field_b * upper, axis=0)
-    d_b = u_b - np.sum(field_b * lower, axis=0)
-    return u_b - d_b * d_z
+    fb = np.ma.filled(field_b, 0)
+    u_b = np.sum(fb * upper, axis=-3)
+    d_b = u_b - np.sum(fb * lower, axis=-3)
+    return np.ma.array(u_b - d_b * d_z, mask=mask, copy=False)
 
 
 def constant_depth(field, grid, depth, zeta=None, threads=2):
@@ -86,6 +114,8 @@ def constant_depth(field, grid, depth, zeta=None, threads=2):
     nfield : ndarray,
         Values from ROMS field on the given constant depth
     """
+    from joblib import Parallel, delayed, effective_n_jobs
+
     grid = seapy.model.asgrid(grid)
     field = np.ma.masked_invalid(field, copy=False)
     depth = depth if depth < 0 else -depth
@@ -95,23 +125,43 @@ def constant_depth(field, grid, depth, zeta=None, threads=2):
     if np.ndim(field) == 3:
         field = seapy.adddim(field)
     nt = field.shape[0]
-    threads = np.minimum(nt, threads)
+    threads = min(nt, effective_n_jobs(threads))
     if zeta is None:
         zeta = np.zeros((nt, 1, 1))
     if np.ndim(zeta) == 2:
         zeta = seapy.adddim(zeta, nt)
 
     v_grid = u_grid = False
-    if field.shape[-2:] == grid.mask_u:
+    if field.shape[-2:] == grid.mask_u.shape:
         u_grid = True
-    elif field.shape[-2:] == grid.mask_v:
+    elif field.shape[-2:] == grid.mask_v.shape:
         v_grid = True
 
-    return np.ma.array(Parallel(n_jobs=threads, verbose=2)
-                       (delayed(__find_surface_thread)
-                        (grid, field[i, :], depth, zeta[i, :],
-                         const_depth=True, u_grid=u_grid, v_grid=v_grid)
-                        for i in range(nt)), copy=False)
+    # The depths are the same for every record, so compute them once and
+    # share them with threads working on contiguous blocks of time. numpy
+    # releases the GIL, so nothing is pickled and the blocks run in parallel.
+    # The search holds several double-precision copies of its block, so
+    # limit each block to about 16 MB of records to bound the memory.
+    factors = __depth_factors(grid)
+    nblk = max(1, 16 * 1024 * 1024 // (8 * np.prod(field.shape[1:])))
+    blocks = [slice(s, s + nblk) for s in range(0, nt, nblk)]
+
+    # Each block writes straight into its slice of the output; anything
+    # left unwritten stays masked
+    nfield = np.zeros((nt,) + field.shape[-2:],
+                      dtype=np.result_type(field.dtype, np.float32))
+    mask = np.ones(nfield.shape, dtype=bool)
+
+    def find_block(t):
+        res = __find_surface_thread(grid, field[t], depth, zeta[t],
+                                    const_depth=True, u_grid=u_grid,
+                                    v_grid=v_grid, factors=factors)
+        nfield[t] = res.data
+        mask[t] = np.ma.getmaskarray(res)
+
+    Parallel(n_jobs=threads, backend="threading", require="sharedmem")(
+        delayed(find_block)(t) for t in blocks)
+    return np.ma.array(nfield, mask=mask, copy=False)
 
 
 def constant_value(field, grid, value, zeta=None, threads=2):
@@ -139,6 +189,8 @@ def constant_value(field, grid, value, zeta=None, threads=2):
     nfield : ndarray,
         Depths from ROMS field on the given value
     """
+    from joblib import Parallel, delayed, effective_n_jobs
+
     grid = seapy.model.asgrid(grid)
     field = np.ma.masked_invalid(field, copy=False)
     if value is None or field.min() > value > field.max():
@@ -147,16 +199,16 @@ def constant_value(field, grid, value, zeta=None, threads=2):
     if np.ndim(field) == 3:
         field = seapy.adddim(field)
     nt = field.shape[0]
-    threads = np.minimum(nt, threads)
+    threads = min(nt, effective_n_jobs(threads))
     if zeta is None:
         zeta = np.zeros((nt, 1, 1))
     if np.ndim(zeta) == 2:
         zeta = seapy.adddim(zeta, nt)
 
     v_grid = u_grid = False
-    if field.shape[-2:] == grid.mask_u:
+    if field.shape[-2:] == grid.mask_u.shape:
         u_grid = True
-    elif field.shape[-2:] == grid.mask_v:
+    elif field.shape[-2:] == grid.mask_v.shape:
         v_grid = True
 
     return np.ma.array(Parallel(n_jobs=threads, verbose=2)
@@ -188,6 +240,8 @@ def constant_value_k(field, grid, value, zeta=None, threads=2):
     nfield : ndarray,
         Depths from ROMS field on the given value
     """
+    from joblib import Parallel, delayed, effective_n_jobs
+
     grid = seapy.model.asgrid(grid)
     field = np.ma.masked_invalid(field, copy=False)
     if value is None or field.min() > value > field.max():
@@ -196,16 +250,16 @@ def constant_value_k(field, grid, value, zeta=None, threads=2):
     if np.ndim(field) == 3:
         field = seapy.adddim(field)
     nt = field.shape[0]
-    threads = np.minimum(nt, threads)
+    threads = min(nt, effective_n_jobs(threads))
     if zeta is None:
         zeta = np.zeros((nt, 1, 1))
     if np.ndim(zeta) == 2:
         zeta = seapy.adddim(zeta, nt)
 
     v_grid = u_grid = False
-    if field.shape[-2:] == grid.mask_u:
+    if field.shape[-2:] == grid.mask_u.shape:
         u_grid = True
-    elif field.shape[-2:] == grid.mask_v:
+    elif field.shape[-2:] == grid.mask_v.shape:
         v_grid = True
 
     return np.ma.array(Parallel(n_jobs=threads, verbose=2)
@@ -253,41 +307,93 @@ def depth_average(field, grid, bottom, top, zeta=None):
         s_w, cs_w = seapy.roms.stretching(grid.vstretching, grid.theta_s,
                                           grid.theta_b, grid.hc,
                                           grid.n, w_grid=True)
-        depths = np.ma.masked_equal(seapy.roms.depth(
-            grid.vtransform, grid.h, grid.hc, grid.s_rho, grid.cs_r) *
-            grid.mask_rho, 0)
-
-        thickness = np.ma.masked_array(seapy.roms.thickness(
-            grid.vtransform, grid.h, grid.hc, s_w, cs_w, zeta) *
-            grid.mask_rho, 0)
-
+        depths = seapy.roms.depth(grid.vtransform, grid.h, grid.hc,
+                                  grid.s_rho, grid.cs_r,
+                                  zeta).astype(np.float32)
+        thickness = seapy.roms.thickness(grid.vtransform, grid.h, grid.hc,
+                                         s_w, cs_w, zeta).astype(np.float32)
     else:
-        depths = np.ma.masked_equal(grid.depth_rho * grid.mask_rho, 0)
-        thickness = np.ma.masked_equal(grid.thick_rho * grid.mask_rho, 0)
+        depths = grid.depth_rho.astype(np.float32)
+        thickness = grid.thick_rho.astype(np.float32)
+
+    # Rather than masked arrays, land is marked by NaN so that it
+    # carries no mask alongside the data
+    land = grid.mask_rho == 0
+    depths[:, land] = np.nan
+    thickness[:, land] = np.nan
 
     # If we are on u- or v-grid, transform
     if field.shape == grid.thick_u.shape:
-        depths = seapy.model.rho2u(depths)
-        thickness = seapy.model.rho2u(thickness)
+        depths = seapy.model.rho2u(depths).filled(np.nan)
+        thickness = seapy.model.rho2u(thickness).filled(np.nan)
     elif field.shape == grid.thick_v.shape:
-        depths = seapy.model.rho2v(depths)
-        thickness = seapy.model.rho2v(thickness)
-
-    # 1. pick all of the points that are deeper and shallower than the limits
-    k_ones = np.arange(grid.n, dtype=int)
-    top_depth = depths[-1, :, :] if top_depth == 0 else top_depth
-    upper = depths - top_depth
-    upper[np.where(upper < 0)] = np.float('inf')
-    lower = depths - depth
-    lower[np.where(lower > 0)] = -np.float('inf')
-    thickness *= np.ma.masked_equal(np.logical_and(
-        k_ones[:, np.newaxis, np.newaxis] <= np.argmin(upper, axis=0),
-        k_ones[:, np.newaxis, np.newaxis] >=
-        np.argmax(lower, axis=0)).astype(int), 0)
-
-    # Do the integration
-    return np.sum(field * thickness, axis=0) / \
-        np.sum(thickness, axis=0)
+        depths = seapy.model.rho2v(depths).filled(np.nan)
+        thickness = seapy.model.rho2v(thickness).filled(np.nan)
+
+    # 1. the depths increase with k, so counting the layers below each
+    # limit gives the first layer at or above the top and the last layer
+    # at or below the bottom
+    k_ones = np.arange(grid.n, dtype=int)[:, np.newaxis, np.newaxis]
+    top_depth = depths[-1, :, :] if top == 0 else top
+    k_top = np.sum(depths < top_depth, axis=0)
+    k_bottom = np.sum(depths <= bottom, axis=0) - 1
+
+    # 2. keep the thickness of the layers between the limits; everything
+    # else (including the all-NaN land columns) contributes zero thickness
+    # to the integral
+    layers = np.logical_and(k_ones <= k_top, k_ones >= k_bottom)
+    thickness = np.where(layers, np.nan_to_num(thickness), 0)
+
+    # Do the integration, contracting over k without forming the product
+    return np.ma.divide(np.einsum("kji,kji->ji", np.ma.filled(field, 0),
+                                  thickness),
+                        np.sum(thickness, axis=0))
+
+
+@lru_cache(maxsize=8)
+def __transect_distance(lon, lat):
+    """
+    Internal function to return the distance of each point along a
+    transect from its first point, given the float64 bytes of the lon and
+    lat arrays. Results are cached, as transect is typically called for
+    many records along the same line.
+    """
+    lon = np.frombuffer(lon)
+    lat = np.frombuffer(lat)
+    dist = np.hstack(([0], seapy.earth_distance(
+        lon[0], lat[0], lon[1:], lat[1:])))
+    dist.flags.writeable = False
+    return dist
+
+
+def __transect_interp(x, dep, dat, xx, zz):
+    """
+    Internal function to interpolate the structured [k,n] source of a
+    transect, with positions x[n] and depths dep[k,n] increasing in k,
+    onto the positions xx at the depths zz. Each source column is
+    interpolated linearly in depth, and the result linearly between the
+    neighboring columns.
+    """
+    # Find the layers bounding each depth in every column
+    k = np.sum(dep[np.newaxis, :, :] <= zz[:, np.newaxis, np.newaxis],
+               axis=1) - 1
+    k = np.clip(k, 0, dep.shape[0] - 2)
+    d0 = np.take_along_axis(dep, k, axis=0)
+    d1 = np.take_along_axis(dep, k + 1, axis=0)
+    v0 = np.take_along_axis(dat, k, axis=0)
+    v1 = np.take_along_axis(dat, k + 1, axis=0)
+    dd = d1 - d0
+    w = np.divide(zz[:, np.newaxis] - d0, dd, out=np.zeros_like(dd),
+                  where=dd != 0)
+    w = np.clip(w, 0, 1)
+    col = v0 + w * (v1 - v0)
+
+    # Find the columns bounding each position
+    i = np.clip(np.searchsorted(x, xx, side="right") - 1, 0, x.size - 2)
+    dx = x[i + 1] - x[i]
+    w = np.divide(xx - x[i], dx, out=np.zeros_like(dx), where=dx != 0)
+    w = np.clip(w, 0, 1)
+    return col[:, i] + w * (col[:, i + 1] - col[:, i])
 
 
 def transect(lon, lat, depth, data, nx=200, nz=40, z=None):
@@ -341,7 +447,6 @@ def transect(lon, lat, depth, data, nx=200, nz=40, z=None):
     >>> nc.close()
     >>> plt.pcolormesh(x/1000, z, transect[0, :, :])
     """
-    from scipy.interpolate import griddata
     depth = np.atleast_2d(depth)
     data = np.ma.atleast_2d(data).filled(np.mean(data))
     lon = np.atleast_1d(lon)
@@ -357,15 +462,17 @@ def transect(lon, lat, depth, data, nx=200, nz=40, z=None):
     dz = np.abs(np.diff(z).mean())
 
     # Determine the distance between points and the weighting to apply
-    dist = np.hstack(([0], seapy.earth_distance(
-        lon[0], lat[0], lon[1:], lat[1:])))
+    dist = __transect_distance(lon.astype(np.float64).tobytes(),
+                               lat.astype(np.float64).tobytes())
     dx = np.diff(dist).mean()
     zscale = np.maximum(1, 10**int(np.log10(dx / dz)))
     dx /= zscale
     x = np.linspace(0, dist.max(), nx)
 
-    # All arrays have to be the same size
-    xx, zz = np.meshgrid(x / zscale, z)
+    # The transect positions; the source and transect share one distance
+    # for every depth, so there is no need to build full 2-D arrays
+    xx = x / zscale
+    dist = dist / zscale
 
     # For the source data, we don't want to extrpolate,
     # so make the data go from the surface to twice its
@@ -378,24 +485,82 @@ def transect(lon, lat, depth, data, nx=200, nz=40, z=None):
     # repeat the same data at the top and bottom
     dat = np.vstack((data[zl[0], :], data[zl],
                      data[zl[-1], :]))
-    dist = np.tile(dist.T, [dep.shape[0], 1]) / zscale
 
     # Find the bottom indices to create a mask for nodata/land
-    idx = np.interp(xx[0, :], dist[0, :],
+    idx = np.interp(xx, dist,
                     np.interp(depth.min(axis=0), z,
                               np.arange(nz))).astype(int)
     mask = np.arange(nz)[:, np.newaxis] <= idx
 
-    # Interpolate
-    ndat = np.ma.array(griddata(
-        (dist.ravel(), dep.ravel()), dat.ravel(), (xx.ravel(), zz.ravel()),
-        method='cubic').reshape(xx.shape), mask=mask)
+    # Interpolate; the source is structured, so we can work column-wise
+    # rather than triangulating the scattered points
+    ndat = np.ma.array(__transect_interp(dist, dep, dat, xx, z), mask=mask)
 
     # Return everything
     return x, z, ndat
 
 
-def gen_std_i(roms_file, std_file, std_window=5, pad=1, skip=30, fields=None):
+def __window_std(data, offsets, width):
+    """
+    Internal function to compute the std over windows of records that
+    start at the given offsets into data. The running sums are built
+    once, so each window costs a difference rather than a new pass over
+    its records. Masked values are excluded, and points without any
+    valid values in a window are masked.
+    """
+    valid = ~np.ma.getmaskarray(data)
+    data = np.ma.filled(data, 0).astype(np.float64)
+    s0 = np.zeros((data.shape[0] + 1,) + data.shape[1:], dtype=np.int32)
+    s1 = np.zeros(s0.shape)
+    s2 = np.zeros_like(s1)
+    np.cumsum(valid, axis=0, out=s0[1:])
+    np.cumsum(data, axis=0, out=s1[1:])
+    np.cumsum(data * data, axis=0, out=s2[1:])
+    offsets = np.asarray(offsets)
+    count = s0[offsets + width] - s0[offsets]
+    mean = np.divide(s1[offsets + width] - s1[offsets], count,
+                     out=np.zeros(count.shape), where=count > 0)
+    var = np.divide(s2[offsets + width] - s2[offsets], count,
+                    out=np.zeros(count.shape), where=count > 0) - mean * mean
+    return np.ma.masked_where(count == 0,
+                              np.sqrt(np.maximum(var, 0)).astype(np.float32))
+
+
+def __record_std(var, records, chunk):
+    """
+    Internal function to compute the std of the netCDF variable over the
+    given records without reading them all at once. Blocks of records
+    are combined into a running mean and sum of squared deviations
+    (Welford/Chan), honoring any masked values. Evenly spaced records
+    are read as strided slices rather than one hyperslab per record.
+    """
+    step = np.diff(records)
+    strided = records.size > 1 and step[0] > 0 and np.all(step == step[0])
+    count = mean = m2 = 0
+    for n in range(0, records.size, chunk):
+        rec = records[n:n + chunk]
+        if strided:
+            dat = var[rec[0]:rec[-1] + 1:step[0], :]
+        else:
+            dat = var[rec, :]
+        dat = np.ma.array(dat, dtype=np.float64, copy=False)
+        cnt = dat.count(axis=0)
+        avg = np.ma.filled(dat.mean(axis=0), 0)
+        sq = np.ma.filled(((dat - avg) ** 2).sum(axis=0), 0)
+        total = count + cnt
+        delta = avg - mean
+        frac = np.divide(cnt, total, out=np.zeros(np.shape(total)),
+                         where=total > 0)
+        mean = mean + delta * frac
+        m2 = m2 + sq + delta * delta * count * frac
+        count = total
+    std = np.sqrt(np.divide(m2, count, out=np.zeros(np.shape(count)),
+                            where=count > 0))
+    return np.ma.masked_where(count == 0, std)
+
+
+def gen_std_i(roms_file, std_file, std_window=5, pad=1, skip=30, fields=None,
+              chunk=None, threads=2):
     """
     Create a std file for the given ocean fields. This std file can be used
     for initial conditions constraint in 4D-Var. This requires a long-term
@@ -419,6 +584,15 @@ def gen_std_i(roms_file, std_file, std_window=5, pad=1, skip=30, fields=None):
     fields: list of str,
         The fields to compute std for. Default is to use the ROMS prognostic
         variables.
+    chunk: int, optional
+        The number of windows to read from and write to the files at once.
+        Larger values reduce the number of reads and writes at the cost of
+        memory. Default is as many windows as keep the 3-D records read,
+        in double precision, to about 64 MB.
+    threads: int, optional
+        Number of threads to use for processing the fields. Reading the file
+        is serialized, but the std of one field is computed while the next
+        is read. Each thread holds its own chunk of records in memory.
 
     Returns
     -------
@@ -451,20 +625,50 @@ def gen_std_i(roms_file, std_file, std_window=5, pad=1, skip=30, fields=None):
 
     # Loop over the time with the variance window:
     time_list = np.arange(skip + pad, len(time) - std_window - pad, std_window)
-    for n, t in track(enumerate(time_list), total=len(time_list),
-                      description="evaluate time window"):
-        idx = np.arange(t - pad, t + std_window + pad)
-        ncout.variables[time_var][n] = np.mean(time[idx])
-        for v in fields:
-            dat = nc.variables[v][idx, :].std(axis=0)
-            dat[dat > 10] = 0.0
-            ncout.variables[v][n, :] = dat
-        ncout.sync()
+    if chunk is None:
+        chunk = max(1, 64 * 1024 * 1024 //
+                    (std_window * grid.ln * grid.lm * grid.n * 8))
+    width = std_window + 2 * pad
+
+    # Write the mean time of every window at once
+    if time_list.size:
+        windows = np.lib.stride_tricks.sliding_window_view(np.asarray(time),
+                                                           width)
+        ncout.variables[time_var][:len(time_list)] = \
+            windows[time_list - pad].mean(axis=1)
+
+    # netCDF is not thread-safe, so all file access is serialized with a
+    # lock and only the std computations run concurrently
+    lock = Lock()
+
+    def window_std(v, rec0, rec1, offsets):
+        with lock:
+            dat = nc.variables[v][rec0:rec1, :]
+        dat = __window_std(dat, offsets, width)
+        dat[dat > 10] = 0.0
+        return dat
+
+    fields = list(fields)
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        for n0 in track(range(0, len(time_list), chunk),
+                        total=int(np.ceil(len(time_list) / chunk)),
+                        description="evaluate time window"):
+            # Read all of the records spanned by this chunk of windows once
+            starts = time_list[n0:n0 + chunk] - pad
+            rec0, rec1 = starts[0], starts[-1] + width
+            results = [pool.submit(window_std, v, rec0, rec1, starts - rec0)
+                       for v in fields]
+            for v, res in zip(fields, results):
+                dat = res.result()
+                with lock:
+                    ncout.variables[v][n0:n0 + len(dat), :] = dat
+            with lock:
+                ncout.sync()
     ncout.close()
     nc.close()
 
 
-def gen_std_f(roms_file, std_file, records=None, fields=None):
+def gen_std_f(roms_file, std_file, records=None, fields=None, chunk=None):
     """
     Create a std file for the given atmospheric forcing fields. This std
     file can be used for the forcing constraint in 4D-Var. This requires a
@@ -483,6 +687,9 @@ def gen_std_f(roms_file, std_file, records=None, fields=None):
     fields: list of str,
         The fields to compute std for. Default is to use the ROMS atmospheric
         variables (sustr, svstr, shflux, ssflux).
+    chunk: int, optional
+        The number of records to read from the file at once. Default is as
+        many 2-D records as fit, in double precision, in about 64 MB.
 
     Returns
     -------
@@ -512,7 +719,12 @@ def gen_std_f(roms_file, std_file, records=None, fields=None):
         records = np.arange(len(time))
     else:
         records = np.atleast_1d(records)
-        records = records[records <= len(time)]
+        # Negative records count from the end, as in numpy indexing, but
+        # are made positive so they can be read as strided slices
+        records = records[(records >= -len(time)) &
+                          (records < len(time))] % len(time)
+    if chunk is None:
+        chunk = max(1, 64 * 1024 * 1024 // (grid.ln * grid.lm * 8))
 
     # If there are any fields that are not part of the standard, add them
     # to the output file
@@ -523,8 +735,8 @@ def gen_std_f(roms_file, std_file, records=None, fields=None):
     # Loop over the time with the variance window:
     ncout.variables[time_var][:] = np.mean(time[records])
     for v in fields:
-        dat = nc.variables[v][records, :].std(axis=0)
-        ncout.variables[v][0, :] = dat
+        ncout.variables[v][0, :] = __record_std(nc.variables[v], records,
+                                                chunk)
         ncout.sync()
     ncout.close()
     nc.close()
@@ -565,26 +777,26 @@ def plot_obs_spatial(obs, type='zeta', prov=None, time=None, depth=0,
     if prov is not None:
         prov = seapy.roms.obs.asprovenance(prov)
     if time is not None:
-        time = np.atleast_1d(time)
+        time = np.sort(np.atleast_1d(time))
 
-    # Search the obs for the user
+    # Search the obs for the user, looking up the obs fields only once
+    otypes, oz, odepth = obs.type, obs.z, obs.depth
+    keep = otypes == otype
+    keep &= (oz == 0) | (odepth == depth)
     if prov is not None:
-        idx = np.where(np.logical_and.reduce((
-            obs.type == otype,
-            obs.provenance == prov,
-            np.logical_or(obs.z == 0, obs.depth == depth))))[0]
-
-    else:
-        idx = np.where(np.logical_and(
-            obs.type == otype,
-            np.logical_or(obs.z == 0, obs.depth == depth)))[0]
+        keep &= obs.provenance == prov
+    idx = np.flatnonzero(keep)
 
     # If there is a time specific condition, find the sets
     if time is not None:
-        idx = idx[np.in1d(obs.time[idx], time)]
+        if not time.size:
+            return
+        otime = obs.time[idx]
+        pos = np.minimum(np.searchsorted(time, otime), time.size - 1)
+        idx = idx[time[pos] == otime]
 
     # If we don't have anything to plot, return
-    if not idx.any():
+    if not idx.size:
         return
 
     # Plot it up
@@ -634,32 +846,32 @@ def plot_obs_profile(obs, type='temp', prov=None, time=None,
     if prov is not None:
         prov = seapy.roms.obs.asprovenance(prov)
     if time is not None:
-        time = np.atleast_1d(time)
+        time = np.sort(np.atleast_1d(time))
 
-    # Search the obs for the user
+    # Search the obs for the user, looking up the obs fields only once
+    otypes, oz, odepth = obs.type, obs.z, obs.depth
+    keep = otypes == otype
+    keep &= (oz < 0) | (odepth < 0)
     if prov is not None:
-        idx = np.where(np.logical_and.reduce((
-            obs.type == otype,
-            obs.provenance == prov,
-            np.logical_or(obs.z < 0, obs.depth < 0))))[0]
-
-    else:
-        idx = np.where(np.logical_and(
-            obs.type == otype,
-            np.logical_or(obs.z < 0, obs.depth < 0)))[0]
+        keep &= obs.provenance == prov
+    idx = np.flatnonzero(keep)
 
     # If there is a time specific condition, find the sets
     if time is not None:
-        idx = idx[np.in1d(obs.time[idx], time)]
+        if not time.size:
+            return
+        otime = obs.time[idx]
+        pos = np.minimum(np.searchsorted(time, otime), time.size - 1)
+        idx = idx[time[pos] == otime]
 
     # If we don't have anything to plot, return
-    if not idx.any():
+    if not idx.size:
         return
 
     # Plot it up
     if gridcoord:
-        dep = obs.z if np.mean(obs.z[idx] > 0) else obs.depth
+        dep = oz if np.mean(oz[idx] > 0) else odepth
     else:
-        dep = obs.z if np.mean(obs.z[idx] < 0) else obs.depth
+        dep = oz if np.mean(oz[idx] < 0) else odepth
     val = obs.value if not error else np.sqrt(obs.error)
     plt.plot(val[idx], dep[idx], 'k+', **kwargs)
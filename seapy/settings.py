@@ -1,4 +1,4 @@
 # lookup table with the name of typical variables
-# used for landmask and depth discovery
+# used for landmask and depth discovery, in order of preference
 # E.g. Names found in most widely used OGCMs (Mercator, HyCOM, etc...)
-MASK_PARSE_VARNAMES = ["temp", "temperature", "water_temp", "fed", "thetao"]
+MASK_PARSE_VARNAMES = ("temp", "temperature", "water_temp", "fed", "thetao")